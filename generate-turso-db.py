@@ -1,52 +1,116 @@
 import subprocess
+import shlex
 import re
-import pyperclip
 import argparse
 import os
 import sys
+import json
+import shutil
+import stat
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+_CREATED_RE = re.compile(r'Created database (\S+)')
+_URL_RE = re.compile(r'URL:\s+(libsql://[\w.-]+)')
+_AUTH_CACHE = os.path.join(os.path.expanduser('~'), '.cache', 'turso-gen', 'deps.json')
+_AUTH_CACHE_TTL = 3600
+
+def _command_argv(command):
+    """Split a command into argv and resolve a bare program name to its absolute path.
+
+    subprocess only takes its posix_spawn() fast path when argv[0] has a directory and
+    close_fds is False; the fds Python opens are non-inheritable, so nothing leaks.
+    """
+    argv = shlex.split(command) if isinstance(command, str) else list(command)
+    if argv and not os.path.dirname(argv[0]):
+        argv[0] = shutil.which(argv[0]) or argv[0]
+    return argv
 
 def run_command(command):
-    """Run a shell command and return its output and error (if any)."""
-    result = subprocess.run(command, shell=True, capture_output=True, text=True)
+    """Run a command and return its output and error (if any).
+
+    Takes an argv list, or a string which is split with shlex. No shell is spawned.
+    """
+    argv = _command_argv(command)
+    try:
+        result = subprocess.run(argv, capture_output=True, text=True, close_fds=False)
+    except FileNotFoundError as e:
+        return "", str(e), 127
     return result.stdout.strip(), result.stderr.strip(), result.returncode
 
+def start_command(command):
+    """Start a command without waiting for it, or return None if it cannot be started."""
+    argv = _command_argv(command)
+    try:
+        return subprocess.Popen(argv, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, close_fds=False)
+    except FileNotFoundError:
+        return None
+
+def finish_command(process):
+    """Wait for a command from start_command and return its output and error (if any)."""
+    stdout, stderr = process.communicate()
+    return stdout.strip(), stderr.strip(), process.returncode
+
+def write_file_atomic(file_path, content):
+    """Write content to a temp file next to file_path and move it into place in one step.
+
+    Symlinks are followed so their target is the file that gets replaced. The temp file
+    is created 0600 by mkstemp, takes the old file's mode before any content is written,
+    and is removed if anything fails before the replace.
+    """
+    real_path = os.path.realpath(file_path)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(real_path),
+                                    prefix=f'.{os.path.basename(real_path)}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            if os.path.exists(real_path):
+                os.chmod(tmp_path, stat.S_IMODE(os.stat(real_path).st_mode))
+            f.write(content)
+        os.replace(tmp_path, real_path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
 def update_env_file(file_path, new_vars):
     if not os.path.exists(file_path):
         print(f"File {file_path} does not exist. Creating new file.")
-        with open(file_path, 'w') as f:
-            f.write('\n'.join(f"{k}={v}" for k, v in new_vars.items()))
+        write_file_atomic(file_path, '\n'.join(f"{k}={v}" for k, v in new_vars.items()))
         return
 
-    with open(file_path, 'r') as f:
-        lines = f.readlines()
-
     updated_lines = []
     updated = {key: False for key in new_vars.keys()}
 
-    for line in lines:
-        line = line.strip()
-        if line.startswith('#') or not line:
-            updated_lines.append(line)
-            continue
-
-        key = line.split('=')[0]
-        if key in new_vars:
-            if not updated[key]:
-                updated_lines.append(f'# Old {line}')
-                updated_lines.append(f'{key}={new_vars[key]}')
-                updated[key] = True
-        else:
-            updated_lines.append(line)
+    with open(file_path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith('#') or not line:
+                updated_lines.append(line)
+                continue
+
+            key = line.partition('=')[0]
+            if key in new_vars:
+                if not updated[key]:
+                    updated_lines.append(f'# Old {line}')
+                    updated_lines.append(f'{key}={new_vars[key]}')
+                    updated[key] = True
+            else:
+                updated_lines.append(line)
 
     for key, value in new_vars.items():
         if not updated[key]:
             updated_lines.append(f'{key}={value}')
 
-    with open(file_path, 'w') as f:
-        f.write('\n'.join(updated_lines) + '\n')
+    write_file_atomic(file_path, '\n'.join(updated_lines) + '\n')
 
 def find_project_root():
-    """Find the project root by looking for .git directory or pyproject.toml file."""
+    """Find the project root from $PROJECT_ROOT/$GIT_ROOT, or by looking for .git directory or pyproject.toml file."""
+    env_root = os.environ.get('PROJECT_ROOT') or os.environ.get('GIT_ROOT')
+    if env_root and os.path.isdir(env_root):
+        return env_root
     current_dir = os.getcwd()
     while True:
         if os.path.exists(os.path.join(current_dir, '.git')) or \
@@ -57,19 +121,65 @@ def find_project_root():
             return None
         current_dir = parent
 
+def _turso_mtime():
+    """Return the mtime of the turso binary, or None if it is not on PATH."""
+    turso_path = shutil.which('turso')
+    return os.stat(turso_path).st_mtime if turso_path else None
+
+def auth_cache_is_fresh():
+    """Check whether a successful auth check was stamped recently for this turso binary."""
+    mtime = _turso_mtime()
+    if mtime is None:
+        return False
+    try:
+        with open(_AUTH_CACHE, 'r') as f:
+            cache = json.load(f)
+        if not isinstance(cache, dict):
+            return False
+        return cache.get('mtime') == mtime and time.time() - cache.get('checked_at', 0) < _AUTH_CACHE_TTL
+    except (OSError, ValueError, TypeError, AttributeError):
+        return False
+
+def save_auth_cache():
+    """Stamp a successful auth check so the next runs can skip it."""
+    try:
+        os.makedirs(os.path.dirname(_AUTH_CACHE), exist_ok=True)
+        write_file_atomic(_AUTH_CACHE, json.dumps({'mtime': _turso_mtime(), 'checked_at': time.time()}))
+    except OSError:
+        pass
+
+def invalidate_auth_cache():
+    """Drop the auth stamp so a stale login is re-checked on the next run."""
+    try:
+        os.remove(_AUTH_CACHE)
+    except OSError:
+        pass
+
+def check_turso_installed():
+    """Check that the Turso CLI is on PATH without spawning it."""
+    if shutil.which('turso') is None:
+        print("Error: Turso CLI not found on PATH.")
+        print("Install it from https://docs.turso.tech/cli/installation and try again.")
+        sys.exit(1)
+
 def check_turso_auth():
     """Check if the user is authenticated with Turso CLI."""
     print("Checking Turso CLI authentication...")
-    output, error, code = run_command("turso auth status")
+    if auth_cache_is_fresh():
+        print("Turso CLI authentication verified recently, skipping check.")
+        return
+    output, error, code = run_command(["turso", "auth", "status"])
     if code != 0 or "You are not logged in" in output:
         print("Error: You are not authenticated with Turso CLI.")
         print("Please run 'turso auth login' to authenticate.")
         sys.exit(1)
+    save_auth_cache()
     print("Turso CLI authentication successful.")
 
 # Set up argument parser
 parser = argparse.ArgumentParser(description='Generate Turso DB credentials and update .env file.')
 parser.add_argument('--overwrite', metavar='PATH', help='Path to .env or .env.local file to overwrite')
+parser.add_argument('--speculate', action='store_true', help='Start creating the database while the auth check runs')
 
 args = parser.parse_args()
 
@@ -79,47 +189,68 @@ if not project_root:
     print("Error: Could not find project root. Make sure you're in a git repository or a directory with pyproject.toml.")
     sys.exit(1)
 
+# Make sure the Turso CLI is installed
+check_turso_installed()
+
+# With --speculate, start creating the database while authentication is checked
+create_process = start_command(["turso", "db", "create"]) if args.speculate else None
+
 # Check Turso CLI authentication
-check_turso_auth()
+try:
+    check_turso_auth()
+except BaseException:
+    if create_process:
+        create_process.terminate()
+        create_process.wait()
+    raise
 
 # Create a new database
 print("Creating new database...")
-create_output, create_error, create_code = run_command("turso db create")
+if create_process:
+    create_output, create_error, create_code = finish_command(create_process)
+else:
+    create_output, create_error, create_code = run_command(["turso", "db", "create"])
 print(f"Output: {create_output}")
 if create_error:
+    invalidate_auth_cache()
     print(f"Error: {create_error}")
     print(f"Return code: {create_code}")
     sys.exit(1)
 
 # Extract database name from create output
-db_name_match = re.search(r'Created database (\S+)', create_output)
+db_name_match = _CREATED_RE.search(create_output)
 if db_name_match:
     db_name = db_name_match.group(1)
 else:
     print("Error: Could not extract database name from output.")
     sys.exit(1)
 
-# Show database details
+# Show database details and create a token concurrently; both only need db_name
 print(f"\nRetrieving details for database: {db_name}")
-show_output, show_error, show_code = run_command(f"turso db show {db_name}")
+print(f"Creating token for database: {db_name}")
+with ThreadPoolExecutor(max_workers=2) as executor:
+    show_future = executor.submit(run_command, ["turso", "db", "show", db_name])
+    token_future = executor.submit(run_command, ["turso", "db", "tokens", "create", db_name])
+    show_output, show_error, show_code = show_future.result()
+    token_output, token_error, token_code = token_future.result()
+
 print(f"Output: {show_output}")
 if show_error:
+    invalidate_auth_cache()
     print(f"Error: {show_error}")
     print(f"Return code: {show_code}")
     sys.exit(1)
 
 # Extract URL from show output
-url_match = re.search(r'URL:\s+(libsql://[\w.-]+)', show_output)
+url_match = _URL_RE.search(show_output)
 db_url = url_match.group(1) if url_match else "URL not found"
 
-# Create a new token
-print(f"\nCreating token for database: {db_name}")
-token_output, token_error, token_code = run_command(f"turso db tokens create {db_name}")
-print("Token created successfully")
 if token_error:
+    invalidate_auth_cache()
     print(f"Error: {token_error}")
     print(f"Return code: {token_code}")
     sys.exit(1)
+print("Token created successfully")
 
 # Get token from token output
 auth_token = token_output.strip()
@@ -138,7 +269,18 @@ if args.overwrite:
 else:
     print("\nNo overwrite path provided. Environment variables will not be saved to a file.")
 
-# Copy to clipboard
-pyperclip.copy(env_vars)
-print("Environment variables have been copied to clipboard. ")
+# Copy to clipboard; pyperclip is only imported here since it probes for a backend on import
+try:
+    import pyperclip
+except ImportError:
+    pyperclip = None
+
+if pyperclip is None:
+    print("pyperclip is not installed, so nothing was copied. Run 'pip install pyperclip' to enable the clipboard.")
+else:
+    try:
+        pyperclip.copy(env_vars)
+        print("Environment variables have been copied to clipboard. ")
+    except pyperclip.PyperclipException as e:
+        print(f"Could not copy to clipboard: {e}")
 print("Much love xxx remcostoeten")